@@ -1,21 +1,54 @@
-from flask import Flask, render_template, request, jsonify, send_file
+# --- Async Mode Selection ---
+# eventlet must monkey-patch the stdlib before anything else imports socket/threading/select.
+# The PyInstaller bundle sticks to plain threads: monkey-patching inside a frozen app is fragile
+# and the bundle only ships engineio's threading driver (see the workaround below).
+import sys
+ASYNC_MODE = "threading"
+if not getattr(sys, "frozen", False):
+    try:
+        import eventlet
+        import eventlet.hubs
+        import eventlet.tpool
+        eventlet.monkey_patch()
+        ASYNC_MODE = "eventlet"
+    except ImportError:
+        pass
+
+from flask import Flask, Response, render_template, request, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_socketio import SocketIO, emit
+from werkzeug.exceptions import NotFound
 import serial
 import serial.tools.list_ports
 import threading
+import selectors
+import socket
+import queue
 import time
 import csv
 import os
 from datetime import datetime
-import sys
-import json
+import functools
+import io
+import glob
+import itertools
+import collections
+import logging
+import signal
+import zlib
+import orjson
+
+# --- Logging ---
+LOG_LEVEL = logging.INFO # Set to logging.DEBUG to trace raw MCU traffic and command handling
+logging.basicConfig(level=LOG_LEVEL, format="%(levelname)s: %(message)s")
+log = logging.getLogger("fermasense")
 
 # --- PyInstaller Workaround for async_mode 'threading' ---
 if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
     try:
         import engineio.async_drivers.threading
     except ImportError:
-        print("DEBUG: Could not import engineio.async_drivers.threading for PyInstaller.")
+        log.debug("Could not import engineio.async_drivers.threading for PyInstaller.")
         pass
 
 # --- Configuration ---
@@ -25,222 +58,906 @@ DATA_DIR = "data"
 MAIN_LOG_FILE = os.path.join(DATA_DIR, "fermentation_log.csv")
 EQ_LOG_FILE = os.path.join(DATA_DIR, "equalization_log.csv")
 CONFIG_FILE = os.path.join(DATA_DIR, "config.json")
+MAIN_FIELDS = ("server_time_iso", "mcu_time_s", "current_temp", "set_temp_min", "set_temp_max", "state", "mode", "ts_ms") # Main log columns, in row tuple order
+EQ_FIELDS = ("server_time_iso", "target_temp", "duration_s", "ts_ms") # Equalization log columns, in row tuple order
 COMMAND_SEND_DELAY = 0.1 # Seconds to wait after sending a command
+STATUS_REQUEST_COALESCE = 0.5 # Seconds a GET_STATUS awaiting its STATUS reply absorbs further GET_STATUS commands
+CSV_FLUSH_ROWS = 50 # Buffered CSV rows that force a write to disk
+CSV_FLUSH_INTERVAL = 1.0 # Seconds before buffered CSV rows are written regardless of count
+CSV_BACKLOG_WARN_ROWS = 1000 # Queued CSV rows before the writer thread reports that disk writes are falling behind
+CSV_BACKLOG_CHECK_INTERVAL = 10.0 # Seconds between CSV writer backlog checks
+CSV_QUEUE_MAX_ROWS = 50000 # Queued CSV rows kept in memory for a stalled disk; newer rows are dropped beyond this
+CSV_FILE_BUFFER = 1 << 17 # Bytes of userspace buffering per CSV log, so a whole batch goes out in one write()
+CSV_ROTATE_BYTES = 32 * 1024 * 1024 # A CSV log this large is renamed with a timestamp suffix and a fresh one started
+CSV_ROTATE_RETRY_INTERVAL = 300.0 # Seconds before retrying a rotation whose rename failed (e.g. file open elsewhere on Windows)
+SERIAL_RX_MAX_LINE = 4096 # Bytes without a newline before the receive buffer is considered garbage
+SERIAL_SELECT_TIMEOUT = 1.0 # Max seconds the reader blocks waiting for serial data before re-checking state
+SERIAL_DRIVER_RX_BUFFER = 65536 # Bytes of receive queue requested from the Windows serial driver
+SERIAL_DRIVER_TX_BUFFER = 8192 # Bytes of transmit queue requested from the Windows serial driver
+SERIAL_READ_CHUNK = 65536 # Max bytes taken per read once the selector reports the port readable
+SERIAL_READ_TIMEOUT = 0.2 # Serial read timeout; also the idle wait when the port can't be select()ed under plain threads
+HISTORY_STREAM_CHUNK_ROWS = 1000 # Chart points per chunk when streaming historical data
+EMIT_BATCH_INTERVAL = 0.1 # Seconds between batched socketio frames for live data and MCU logs
+EMIT_MAX_DATA_POINTS = 10 # Live points per new_data_batch frame; faster MCU rates are thinned here, the CSV keeps every row
+SERIAL_PORTS_CACHE_TTL = 2.0 # Seconds a serial port enumeration is reused
+MCU_LOG_RATE_LIMITS = {"info": 20, "cmd_recv": 20, "warn": 10, "unknown": 10, "error": 5} # Max MCU log lines per second sent to clients, per type
+MCU_LOG_SUPPRESSED_SUMMARY_INTERVAL = 1.0 # Seconds between "messages suppressed" summaries
+RECENT_HISTORY_POINTS = 20000 # Chart points kept in memory, so recent ?from windows are served without touching the CSV
+CSV_TAIL_READ_BLOCK = 64 * 1024 # Bytes read per step when scanning a CSV log backwards for ?limit=N
+MAIN_REQUIRED_FIELDS = ["server_time_iso", "current_temp", "set_temp_min", "set_temp_max"] # Columns the chart needs from the main log
+EQ_REQUIRED_FIELDS = ("server_time_iso", "target_temp", "duration_s") # Columns the equalization chart needs
+HISTORY_CACHE_MAX_BYTES = 8 * 1024 * 1024 # Largest full-log JSON body kept for repeat requests while the log is unchanged
+LOG_DOWNLOAD_CHUNK = 64 * 1024 # Bytes read per step when gzipping a log download
+LOG_DOWNLOAD_GZIP_LEVEL = 6 # zlib level for log downloads; CSVs of floats compress well even at fast levels
+HISTORY_GZIP_LEVEL = 1 # zlib level for the full history stream, compressed again on every request; level 1 already gets ~17x
+
+# --- JSON Encoding ---
+class OrjsonSocketJson:
+    # python-socketio/engineio call json.dumps(data, separators=...) and expect a str back
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+class OrjsonProvider(JSONProvider):
+    # Backs jsonify() and request.get_json() with orjson, so nothing falls back to the stdlib encoder
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(orjson.dumps(self._prepare_response_obj(args, kwargs)), mimetype="application/json")
+
+# Frames that repeat on every connect/reconnect are encoded once per distinct value
+# and embedded as-is by OrjsonSocketJson.
+@functools.lru_cache(maxsize=32)
+def serial_port_status_frame(status, message, port):
+    return orjson.Fragment(orjson.dumps({"status": status, "message": message, "port": port}))
+
+@functools.lru_cache(maxsize=8)
+def serial_ports_frame(ports):
+    return orjson.Fragment(orjson.dumps(list(ports)))
+
+def json_response(obj, status=200):
+    return Response(orjson.dumps(obj), status=status, mimetype="application/json")
 
 # --- Flask App Setup ---
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.config["SECRET_KEY"] = "fermasense_secret_!@#_v2"
-socketio = SocketIO(app, async_mode="threading")
+app.json = OrjsonProvider(app)
+socketio = SocketIO(app, async_mode=ASYNC_MODE, json=OrjsonSocketJson)
 ser = None # Global serial object
-serial_lock = threading.Lock() # To protect serial operations (opening, closing, writing)
+serial_reset_requested = threading.Event() # Set by set_serial_port; serial_reader_thread, the port's only owner, reopens it
+command_queue = queue.Queue() # Outgoing commands, written by serial_reader_thread which owns the port
+# Wakes the reader's selector as soon as a command is queued
+command_wakeup_recv, command_wakeup_send = socket.socketpair()
+command_wakeup_recv.setblocking(False)
+command_wakeup_send.setblocking(False)
 shutdown_event = threading.Event()
+serial_reader_stopped = threading.Event()
+emit_flusher_stopped = threading.Event()
+csv_writer_stopped = threading.Event()
+ports_cache = {"ts": None, "val": (), "usb": ()} # Last serial port enumeration (monotonic time, all device names, USB device names)
+ports_cache_lock = threading.Lock()
+connected_clients = set() # SIDs of connected web clients; broadcasts are skipped while empty
+last_serial_port_status = None # Last broadcast (status, message, port), to drop repeated frames
+status_requested_at = None # Monotonic time the unanswered GET_STATUS was written; only touched by the serial reader
 
 # --- Helper Functions ---
 def ensure_dir_exists(directory):
-    if not os.path.exists(directory):
-        print(f"DEBUG: Creating directory: {directory}")
-        os.makedirs(directory)
+    # One makedirs call instead of exists() + makedirs(); also can't race another creator
+    os.makedirs(directory, exist_ok=True)
+
+def get_available_serial_ports(force_refresh=False):
+    # Port enumeration scans /sys or the Windows registry, so results are shared for SERIAL_PORTS_CACHE_TTL
+    with ports_cache_lock:
+        # Monotonic, so a wall-clock adjustment can't pin a stale list or force rescans
+        now = time.monotonic()
+        if force_refresh or ports_cache["ts"] is None or now - ports_cache["ts"] >= SERIAL_PORTS_CACHE_TTL:
+            ports = serial.tools.list_ports.comports()
+            ports_cache["val"] = tuple(port.device for port in ports)
+            # Boards enumerate as USB devices; on-board UARTs (ttyS*, Bluetooth COM ports) have no VID
+            ports_cache["usb"] = tuple(port.device for port in ports if port.vid is not None)
+            ports_cache["ts"] = now
+            log.debug("Available serial ports: %s", ports_cache['val'])
+        return ports_cache["val"]
 
-def get_available_serial_ports():
-    ports = serial.tools.list_ports.comports()
-    port_devices = [port.device for port in ports]
-    print(f"DEBUG: Available serial ports: {port_devices}")
-    return port_devices
+def get_auto_detect_serial_port():
+    # Auto-detect picks the first USB serial device, and only falls back to any port when there is none
+    ports = get_available_serial_ports(force_refresh=True)
+    with ports_cache_lock:
+        usb_ports = ports_cache["usb"]
+    if usb_ports:
+        return usb_ports[0]
+    return ports[0] if ports else None
 
 def load_config():
     global SERIAL_PORT
-    ensure_dir_exists(DATA_DIR)
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, "r") as f:
-                config = json.load(f)
+            with open(CONFIG_FILE, "rb") as f:
+                config = orjson.loads(f.read())
                 SERIAL_PORT = config.get("serial_port", None)
-                print(f"DEBUG: Loaded serial port from config: {SERIAL_PORT}")
+                log.debug("Loaded serial port from config: %s", SERIAL_PORT)
         except Exception as e:
-            print(f"ERROR: Error loading config: {e}")
+            log.error("Error loading config: %s", e)
             SERIAL_PORT = None
     else:
-        print("DEBUG: No config file found. Attempting auto-detection.")
-        ports = get_available_serial_ports()
-        if ports:
-            SERIAL_PORT = ports[0]
-            print(f"DEBUG: No config file, auto-selected serial port: {SERIAL_PORT}")
+        log.debug("No config file found. Attempting auto-detection.")
+        SERIAL_PORT = get_auto_detect_serial_port()
+        if SERIAL_PORT:
+            log.debug("No config file, auto-selected serial port: %s", SERIAL_PORT)
             save_config()
         else:
-            SERIAL_PORT = None
-            print("DEBUG: No config file and no serial ports detected on startup.")
+            log.debug("No config file and no serial ports detected on startup.")
 
 def save_config():
-    ensure_dir_exists(DATA_DIR)
     try:
-        with open(CONFIG_FILE, "w") as f:
-            json.dump({"serial_port": SERIAL_PORT}, f)
-        print(f"DEBUG: Saved serial port to config: {SERIAL_PORT}")
+        # Write a temp file and swap it in, so a crash mid-write can't leave a torn config behind
+        tmp_path = CONFIG_FILE + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps({"serial_port": SERIAL_PORT}))
+        os.replace(tmp_path, CONFIG_FILE)
+        log.debug("Saved serial port to config: %s", SERIAL_PORT)
     except Exception as e:
-        print(f"ERROR: Error saving config: {e}")
+        log.error("Error saving config: %s", e)
 
-def log_to_csv(file_path, data_dict, fieldnames):
-    ensure_dir_exists(DATA_DIR)
-    file_exists = os.path.isfile(file_path)
+def run_blocking(fn, *args):
+    # Under eventlet the CSV writer is a greenlet, so a slow disk would stall every other greenlet with it;
+    # run the call on eventlet's OS thread pool instead. Only for plain file calls: no logging or locks.
+    if ASYNC_MODE == "eventlet":
+        return eventlet.tpool.execute(fn, *args)
+    return fn(*args)
+
+class CsvBatchWriter:
+    def __init__(self, file_path, fieldnames, backfill=None, row_json=None, row_format=None):
+        self.file_path = file_path
+        self.fieldnames = tuple(fieldnames)
+        self.row_format = row_format # %-format for one row tuple incl. "\r\n"; skips csv.writer for plain rows
+        self.backfill = backfill # Fills in columns missing from rows of an older log layout
+        self.row_json = row_json # Row tuple -> history JSON item, for keeping history_cache current
+        self.layout_checked = False # Header layout is verified once per process, not per open
+        self.fh = None
+        self.writer = None
+        self.buf = []
+        self.last_flush = time.time()
+        self.rotate_retry_at = 0.0 # After a failed rotation, keep appending to the current log until then
+
+    def _open(self):
+        # Only runs when the handle is (re)opened, so a data dir removed at runtime is recreated
+        ensure_dir_exists(DATA_DIR)
+        if not self.layout_checked:
+            self.layout_checked = True
+            try:
+                self._check_layout()
+            except (OSError, ValueError, csv.Error) as e:
+                # Keep logging into the file as it is rather than dropping every batch on a retry
+                log.error("Error checking CSV layout of %s: %s", self.file_path, e)
+                queue_broadcast("mcu_log", {"type": "error", "message": f"CSV Layout Error: {e}"})
+        self.fh = open(self.file_path, "a", newline="", encoding="utf-8", buffering=CSV_FILE_BUFFER)
+        # Rows are tuples already in fieldnames order, so the plain csv.writer is enough
+        self.writer = csv.writer(self.fh)
+        # Append mode starts at the end of the file, so position 0 means it is new or empty
+        if self.fh.tell() == 0:
+            self.writer.writerow(self.fieldnames)
+        log.debug("Opened CSV log %s for batched writes.", self.file_path)
+
+    def _check_layout(self):
+        try:
+            with open(self.file_path, "r", newline="", encoding="utf-8", errors="replace") as f:
+                existing_fieldnames = next(csv.reader(f), None)
+        except FileNotFoundError:
+            return
+        if existing_fieldnames and tuple(existing_fieldnames) != self.fieldnames:
+            self._upgrade_layout(existing_fieldnames)
+
+    def _upgrade_layout(self, existing_fieldnames):
+        # Rewrite a log created with an older column layout so appended rows line up with the header
+        log.info("Upgrading CSV log %s columns %s -> %s", self.file_path, existing_fieldnames, self.fieldnames)
+        tmp_path = self.file_path + ".tmp"
+        not_backfilled = run_blocking(self._copy_upgraded, tmp_path)
+        if not_backfilled:
+            log.warning("Could not backfill %s rows in %s.", not_backfilled, self.file_path)
+        os.replace(tmp_path, self.file_path)
+
+    def _copy_upgraded(self, tmp_path):
+        # Runs via run_blocking, so it counts the rows it could not backfill instead of logging them
+        not_backfilled = 0
+        with open(self.file_path, "r", newline="", encoding="utf-8", errors="replace") as src, \
+                open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+            writer = csv.DictWriter(dst, fieldnames=self.fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            for row in csv.DictReader(src):
+                if self.backfill:
+                    try:
+                        self.backfill(row)
+                    except (ValueError, KeyError, TypeError):
+                        not_backfilled += 1
+                writer.writerow(row)
+        return not_backfilled
+
+    def append(self, row):
+        self.buf.append(row)
+        if len(self.buf) >= CSV_FLUSH_ROWS or time.time() - self.last_flush > CSV_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush_if_due(self):
+        if self.buf and time.time() - self.last_flush > CSV_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.buf:
+            return
+        try:
+            if self.fh is None:
+                self._open()
+            stat_before = os.fstat(self.fh.fileno()) if self.row_json else None
+            text = "".join([self.row_format % row for row in self.buf]) if self.row_format else None
+            # Fields come from a comma split, so only a stray quote or CR (line noise) needs csv quoting
+            if text is not None and ('"' in text or text.count("\r") != len(self.buf)):
+                text = None
+            run_blocking(self.write_batch, text)
+            if stat_before is not None:
+                extend_history_cache(self.file_path, stat_before, os.fstat(self.fh.fileno()), self.buf, self.row_json)
+        except (OSError, ValueError, csv.Error) as e:
+            log.error("Error writing to CSV %s: %s", self.file_path, e)
+            queue_broadcast("mcu_log", {"type": "error", "message": f"CSV Write Error: {e}"})
+            self.close_handle()
+        finally:
+            self.buf.clear() # A batch that failed is dropped, not retried on every later row
+        if self.fh is not None and self.fh.tell() >= CSV_ROTATE_BYTES and time.time() >= self.rotate_retry_at:
+            self.rotate()
+
+    def write_batch(self, text):
+        # Runs via run_blocking: the preformatted batch, or None to let csv.writer quote the rows
+        if text is not None:
+            self.fh.write(text)
+        else:
+            self.writer.writerows(self.buf)
+        self.fh.flush()
+
+    def rotate(self):
+        # The full log is kept beside the new one as e.g. fermentation_log.20260101-120000-00.csv;
+        # the next flush opens a fresh file with a header. The counter keeps two rotations within
+        # the same second from replacing each other and still sorts chronologically.
+        self.close()
+        stem, ext = os.path.splitext(self.file_path)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        n = 0
+        rotated_path = f"{stem}.{stamp}-{n:02d}{ext}"
+        while os.path.exists(rotated_path):
+            n += 1
+            rotated_path = f"{stem}.{stamp}-{n:02d}{ext}"
+        try:
+            os.replace(self.file_path, rotated_path)
+            log.info("Rotated CSV log %s to %s.", self.file_path, rotated_path)
+        except OSError as e:
+            self.rotate_retry_at = time.time() + CSV_ROTATE_RETRY_INTERVAL
+            log.error("Error rotating CSV %s, retrying in %.0f s: %s", self.file_path, CSV_ROTATE_RETRY_INTERVAL, e)
+
+    def close_handle(self):
+        if self.fh is not None:
+            try:
+                self.fh.close()
+            except IOError as e:
+                log.error("Error closing CSV %s: %s", self.file_path, e)
+        self.fh = None
+        self.writer = None
+
+    def close(self):
+        self.flush()
+        # Batches are only flushed to the page cache; make sure the tail is on disk before exiting
+        if self.fh is not None:
+            try:
+                run_blocking(os.fsync, self.fh.fileno())
+            except OSError as e:
+                log.error("Error syncing CSV %s: %s", self.file_path, e)
+        self.close_handle()
+
+def backfill_ts_ms(row):
+    row["ts_ms"] = int(datetime.fromisoformat(row["server_time_iso"]).timestamp() * 1000)
+
+def main_row_json(row):
+    return history_point_json((row[7], row[2], row[3], row[4])) # ts_ms, current_temp, set_temp_min, set_temp_max
+
+def eq_row_json(row):
+    return {"server_time_iso": row[0], "target_temp": row[1], "duration_s": row[2], "ts_ms": row[3]}
+
+# Same output as csv.writer for these rows (%r of a float is its repr, as csv writes it), at well under half the cost
+MAIN_ROW_FORMAT = "%s,%r,%r,%r,%r,%s,%s,%d\r\n"
+EQ_ROW_FORMAT = "%s,%r,%r,%d\r\n"
+
+main_log_writer = CsvBatchWriter(MAIN_LOG_FILE, MAIN_FIELDS, backfill=backfill_ts_ms, row_json=main_row_json,
+                                 row_format=MAIN_ROW_FORMAT)
+eq_log_writer = CsvBatchWriter(EQ_LOG_FILE, EQ_FIELDS, backfill=backfill_ts_ms, row_json=eq_row_json,
+                               row_format=EQ_ROW_FORMAT)
+
+# --- CSV Writer Thread ---
+# The serial reader only queues rows; all log file I/O happens on this thread. Under eventlet this "thread"
+# is a greenlet on the same hub as the serial reader, which is why the slow file calls go through run_blocking.
+csv_row_queue = queue.Queue(maxsize=CSV_QUEUE_MAX_ROWS) # (CsvBatchWriter, row) pairs; None tells the writer thread to stop
+csv_rows_dropped = 0 # Only incremented by the serial reader
+csv_rows_dropped_reported = 0 # Only touched by the writer thread
+
+def log_csv_row(writer, row):
+    global csv_rows_dropped
+    # Never block the serial reader on a stalled disk; losing log rows beats overrunning the UART
     try:
-        with open(file_path, "a", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            # Write header if the file is new OR if it exists but is empty
-            if not (file_exists and os.path.getsize(file_path) > 0):
-                writer.writeheader()
-            writer.writerow(data_dict)
-    except IOError as e:
-        print(f"ERROR: Error writing to CSV {file_path}: {e}")
-        socketio.emit("mcu_log", {"type": "error", "message": f"CSV Write Error: {e}"})
+        csv_row_queue.put_nowait((writer, row))
+    except queue.Full:
+        csv_rows_dropped += 1
+
+def check_csv_backlog():
+    global csv_rows_dropped_reported
+    # A growing queue means the disk can't keep up with the MCU
+    backlog = csv_row_queue.qsize()
+    if backlog > CSV_BACKLOG_WARN_ROWS:
+        log.warning("CSV writer is %s rows behind.", backlog)
+        queue_broadcast("mcu_log", {"type": "warn", "message": f"Log writes are falling behind ({backlog} rows queued)."})
+    dropped = csv_rows_dropped - csv_rows_dropped_reported
+    if dropped:
+        csv_rows_dropped_reported += dropped
+        log.error("CSV write queue full; dropped %s rows.", dropped)
+        queue_broadcast("mcu_log", {"type": "error", "message": f"Log writes fell too far behind; {dropped} rows were not saved."})
+
+def csv_writer_thread():
+    log.info("CSV writer thread started.")
+    last_backlog_check = time.time()
+    rows_since_yield = 0
+    while True:
+        try:
+            item = csv_row_queue.get(timeout=CSV_FLUSH_INTERVAL)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            break
+        try:
+            if item:
+                writer, row = item
+                writer.append(row)
+                rows_since_yield += 1
+                if rows_since_yield >= CSV_FLUSH_ROWS:
+                    # get() on a non-empty queue never yields, so under eventlet draining a backlog
+                    # would otherwise starve the serial reader and client sockets
+                    rows_since_yield = 0
+                    socketio.sleep(0)
+            main_log_writer.flush_if_due()
+            eq_log_writer.flush_if_due()
+            if time.time() - last_backlog_check > CSV_BACKLOG_CHECK_INTERVAL:
+                last_backlog_check = time.time()
+                check_csv_backlog()
+        except Exception as e: # Keep logging; a dead writer thread would silently stop the CSV logs for good
+            log.error("Unexpected error in csv_writer_thread loop: %s: %s", e.__class__.__name__, e)
+            queue_broadcast("mcu_log", {"type": "error", "message": f"CSV writer error: {e}"})
+            socketio.sleep(1)
+    main_log_writer.close()
+    eq_log_writer.close()
+    log.info("CSV writer thread stopped.")
+    csv_writer_stopped.set()
+
+# --- Recent History ---
+# The newest chart points as (ts_ms, current_temp, set_temp_min, set_temp_max), appended by the
+# DATA handler so the default /get_historical_data request is served without touching the CSV.
+recent_history = collections.deque(maxlen=RECENT_HISTORY_POINTS)
+
+def history_point_parser(fieldnames):
+    # Returns a parser for csv.reader rows of a main log with this header; columns are looked up
+    # once here so each row is plain positional indexing instead of a DictReader dict.
+    iso_i, current_i, min_i, max_i = (fieldnames.index(f) for f in MAIN_REQUIRED_FIELDS)
+    ts_i = fieldnames.index("ts_ms") if "ts_ms" in fieldnames else None
+    def parse(row):
+        ts_ms = row[ts_i] if ts_i is not None and ts_i < len(row) else None
+        # Rows from logs written before the ts_ms column existed fall back to the ISO timestamp
+        x = int(ts_ms) if ts_ms else datetime.fromisoformat(row[iso_i]).timestamp() * 1000
+        return (x, float(row[current_i]), float(row[min_i]), float(row[max_i]))
+    return parse
+
+def history_point_json(point):
+    return {"x": point[0], "current_temp": point[1], "set_temp_min": point[2], "set_temp_max": point[3]}
+
+def seed_recent_history():
+    # Takes the tail of the current log, topped up from the newest rotated logs when it is short
+    tails = []
+    needed = RECENT_HISTORY_POINTS
+    for file_path in reversed(log_segments(MAIN_LOG_FILE)):
+        try:
+            with open(file_path, "r", newline="", encoding="utf-8", errors="replace") as csvfile:
+                header = next(csv.reader([csvfile.readline()]), None)
+                if not header or not all(f in header for f in MAIN_REQUIRED_FIELDS):
+                    continue
+                tail = collections.deque(csvfile, maxlen=needed)
+        except FileNotFoundError:
+            continue # Rotated away since it was listed
+        except IOError as e:
+            log.error("Error seeding recent history from %s: %s", file_path, e)
+            continue
+        tails.append((history_point_parser(header), tail))
+        needed -= len(tail)
+        if needed <= 0:
+            break
+    for parse, tail in reversed(tails):
+        for row in csv.reader(tail):
+            try:
+                recent_history.append(parse(row))
+            except (ValueError, IndexError) as e:
+                log.debug("Skipping malformed row in main CSV: %s - %s", row, e)
+    if recent_history:
+        log.info("Loaded %s recent points from %s.", len(recent_history), MAIN_LOG_FILE)
+
+# Full-log JSON bodies keyed by the log's (st_mtime_ns, st_size) when they were read,
+# so repeat requests (several tabs, reloads) skip the CSV until the log changes.
+history_cache = {} # file path -> (stat key, body, True if the body is NDJSON rather than a JSON array)
+history_cache_lock = threading.Lock()
+
+def cached_history(file_path):
+    # Returns (stat key, cached body or None); raises FileNotFoundError for a missing log
+    st = os.stat(file_path)
+    key = (st.st_mtime_ns, st.st_size)
+    with history_cache_lock:
+        entry = history_cache.get(file_path)
+    return key, (entry[1] if entry and entry[0] == key else None)
+
+def extend_history_cache(file_path, stat_before, stat_after, rows, row_json):
+    # Called by CsvBatchWriter after appending rows: if the cached body matches the file as it was
+    # before the write, splice the new rows onto it so the cache stays valid while logging
+    with history_cache_lock:
+        entry = history_cache.get(file_path)
+        if not entry or entry[0] != (stat_before.st_mtime_ns, stat_before.st_size):
+            return
+        body = entry[1]
+        if entry[2]:
+            body += ndjson_chunk([row_json(row) for row in rows])
+        else:
+            added = orjson.dumps([row_json(row) for row in rows])
+            body = body[:-1] + (b"," if len(body) > 2 else b"") + added[1:]
+        if len(body) > HISTORY_CACHE_MAX_BYTES:
+            del history_cache[file_path]
+        else:
+            history_cache[file_path] = ((stat_after.st_mtime_ns, stat_after.st_size), body, entry[2])
+
+def store_history(file_path, key, body, ndjson=False):
+    if len(body) <= HISTORY_CACHE_MAX_BYTES:
+        with history_cache_lock:
+            history_cache[file_path] = (key, body, ndjson)
+
+# --- Batched SocketIO Emits ---
+# Live DATA rows and MCU log lines are buffered and sent as one frame per
+# EMIT_BATCH_INTERVAL instead of one websocket message per serial line.
+# The serial reader and CSV writer never emit themselves, so a slow client can't stall them.
+pending_events = [] # (event, payload) pairs sent as-is, in order
+pending_data_payloads = [] # MAIN_FIELDS-ordered row tuples
+pending_mcu_logs = []
+emit_buffer_lock = threading.Lock()
+emit_pending = threading.Event() # Set when something is buffered, so an idle flusher doesn't wake every interval
+mcu_log_buckets = {log_type: [rate, time.time()] for log_type, rate in MCU_LOG_RATE_LIMITS.items()} # [tokens, last refill]
+mcu_log_suppressed = {} # Log type -> lines dropped since the last summary
+last_suppressed_summary = 0.0
+
+def broadcast(event, payload):
+    # Nobody to send to: skip the serialization and socketio bookkeeping entirely
+    if connected_clients:
+        socketio.emit(event, payload)
+
+def broadcast_serial_port_status(status, message, port):
+    global last_serial_port_status
+    # The reconnect loop reports the same failure every retry; only changes go out
+    if (status, message, port) == last_serial_port_status:
+        return
+    last_serial_port_status = (status, message, port)
+    queue_broadcast("serial_port_status", serial_port_status_frame(status, message, port))
+
+def queue_broadcast(event, payload):
+    if not connected_clients:
+        return
+    with emit_buffer_lock:
+        pending_events.append((event, payload))
+    if not emit_pending.is_set():
+        emit_pending.set()
+
+def queue_new_data(row):
+    if not connected_clients:
+        return
+    with emit_buffer_lock:
+        pending_data_payloads.append(row)
+    if not emit_pending.is_set():
+        emit_pending.set()
+
+def allow_mcu_log(log_type):
+    # Token bucket per log type, refilled at its MCU_LOG_RATE_LIMITS rate; other types are not limited
+    bucket = mcu_log_buckets.get(log_type)
+    if bucket is None:
+        return True
+    rate = MCU_LOG_RATE_LIMITS[log_type]
+    now = time.time()
+    bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return True
+    mcu_log_suppressed[log_type] = mcu_log_suppressed.get(log_type, 0) + 1
+    return False
+
+def queue_mcu_log(log_type, message):
+    if not connected_clients:
+        return
+    with emit_buffer_lock:
+        if not allow_mcu_log(log_type):
+            return
+        pending_mcu_logs.append({"type": log_type, "message": message})
+    if not emit_pending.is_set():
+        emit_pending.set()
+
+def flush_emit_buffers():
+    global pending_events, pending_data_payloads, pending_mcu_logs, last_suppressed_summary
+    with emit_buffer_lock:
+        events, pending_events = pending_events, []
+        data_batch, pending_data_payloads = pending_data_payloads, []
+        log_batch, pending_mcu_logs = pending_mcu_logs, []
+        if mcu_log_suppressed and time.time() - last_suppressed_summary >= MCU_LOG_SUPPRESSED_SUMMARY_INTERVAL:
+            counts = ", ".join(f"{count} {log_type}" for log_type, count in mcu_log_suppressed.items())
+            log_batch.append({"type": "warn", "message": f"MCU log rate limit: suppressed {counts} messages"})
+            mcu_log_suppressed.clear()
+            last_suppressed_summary = time.time()
+    for event, payload in events:
+        broadcast(event, payload)
+    if data_batch:
+        if len(data_batch) > EMIT_MAX_DATA_POINTS:
+            # Thin evenly, always ending on the newest row since that is what the status readouts show
+            step = len(data_batch) / EMIT_MAX_DATA_POINTS
+            last = len(data_batch) - 1
+            data_batch = [data_batch[last - int(i * step)] for i in range(EMIT_MAX_DATA_POINTS - 1, -1, -1)]
+        # Payload dicts are built here, once per batch, rather than on the serial reader thread
+        broadcast("new_data_batch", [dict(zip(MAIN_FIELDS, row)) for row in data_batch])
+    if log_batch:
+        broadcast("mcu_log_batch", log_batch)
+
+def emit_flusher_thread():
+    log.info("Emit flusher thread started.")
+    while not shutdown_event.is_set():
+        # Wake on the first buffered item, then give the batch EMIT_BATCH_INTERVAL to fill.
+        # The timeout still lets pending "suppressed" summaries and shutdown through when idle.
+        if emit_pending.wait(timeout=MCU_LOG_SUPPRESSED_SUMMARY_INTERVAL):
+            socketio.sleep(EMIT_BATCH_INTERVAL)
+        emit_pending.clear()
+        flush_emit_buffers()
+    flush_emit_buffers()
+    log.info("Emit flusher thread stopped.")
+    emit_flusher_stopped.set()
+
+# --- MCU Line Handlers ---
+iso_second_cache = [None, ""] # [epoch second, local "YYYY-MM-DDTHH:MM:SS."] for fast_iso
+
+def fast_iso(now):
+    # Same layout as datetime.isoformat(), but the date/time part is formatted once per second.
+    # %06d truncates the float like int() and measured faster than the equivalent f-string.
+    second = int(now)
+    if second != iso_second_cache[0]:
+        iso_second_cache[0] = second
+        iso_second_cache[1] = time.strftime("%Y-%m-%dT%H:%M:%S.", time.localtime(second))
+    return "%s%06d" % (iso_second_cache[1], (now - second) * 1e6)
+
+# Each handler gets the line, its comma-split parts and the epoch time it was received,
+# and returns False when the line does not have the expected shape,
+# in which case it is reported as an unknown MCU line.
+def process_data_line(line, parts, now):
+    if len(parts) != 7:
+        return False
+    try:
+        _, mcu_time_s, current_temp, set_temp_min, set_temp_max, state, mode = parts
+        current_temp = float(current_temp)
+        set_temp_min = float(set_temp_min)
+        set_temp_max = float(set_temp_max)
+        ts_ms = int(now * 1000) # Epoch ms, so readers never have to parse server_time_iso
+        # One MAIN_FIELDS-ordered tuple serves both the CSV row and the live payload
+        row = (fast_iso(now), float(mcu_time_s), current_temp, set_temp_min, set_temp_max, state, mode, ts_ms)
+        queue_new_data(row)
+        log_csv_row(main_log_writer, row)
+        recent_history.append((ts_ms, current_temp, set_temp_min, set_temp_max))
+    except ValueError as e:
+        log.error("Parsing DATA line: %s - %s", line, e)
+        queue_mcu_log("error", f"Data parse error: {line}")
+    return True
+
+def process_equalized_line(line, parts, now):
+    if len(parts) != 4:
+        return False
+    try:
+        server_time_iso = fast_iso(now)
+        target_temp = float(parts[1]) # This is target_temp_min from Arduino
+        duration_s = float(parts[3])
+        ts_ms = int(now * 1000)
+        queue_broadcast("equalization_update", {
+            "server_time_iso": server_time_iso,
+            "target_temp": target_temp,
+            "duration_s": duration_s,
+            "ts_ms": ts_ms,
+        })
+        log_csv_row(eq_log_writer, (server_time_iso, target_temp, duration_s, ts_ms))
+        queue_mcu_log("info", f"Equalized to {parts[1]}-{parts[2]}°C in {parts[3]}s")
+    except ValueError as e:
+        log.error("Parsing EQUALIZED line: %s - %s", line, e)
+        queue_mcu_log("error", f"Equalization parse error: {line}")
+    return True
+
+def process_status_line(line, parts, now):
+    global status_requested_at
+    if len(parts) < 10: # Ensure enough parts for all fields
+        return False
+    status_requested_at = None
+    try:
+        status_payload = {
+            "mcu_time_s": float(parts[1]),
+            "current_temp": float(parts[2]),
+            "set_temp_min": float(parts[3]),
+            "set_temp_max": float(parts[4]),
+            "state": parts[5],
+            "mode": parts[6],
+            "frequency_ms": int(parts[7]),
+            "is_equalizing": parts[8] == "TIMING_EQ",
+            "setpoint_change_time_s": float(parts[9]),
+        }
+        queue_broadcast("initial_status", status_payload)
+    except Exception as e:
+        message = f"Error parsing STATUS: {e} (Line: {line})"
+        log.error(message)
+        queue_mcu_log("error", message)
+    return True
+
+MCU_LOG_TYPES = {"INFO": "info", "ERROR": "error", "CMD_RECV": "cmd_recv", "WARN": "warn"} # MCU line prefix -> mcu_log type
+
+def log_line_handler(log_type):
+    # One handler per prefix, so the mcu_log type is bound here rather than looked up per line
+    def process_log_line(line, parts, now):
+        queue_mcu_log(log_type, line)
+        return True
+    return process_log_line
+
+MCU_LINE_HANDLERS = {
+    "DATA": process_data_line,
+    "EQUALIZED": process_equalized_line,
+    "STATUS": process_status_line,
+    **{prefix: log_line_handler(log_type) for prefix, log_type in MCU_LOG_TYPES.items()},
+}
 
 # --- Serial Communication Thread ---
+def open_serial_selector(serial_port):
+    # Windows serial handles are not selectable (DefaultSelector there only takes sockets, and pyserial's
+    # fileno() is the io.RawIOBase one that raises); the reader falls back to in_waiting/read there.
+    if os.name == "nt":
+        return None
+    try:
+        fd = serial_port.fileno()
+    except (AttributeError, OSError): # io.UnsupportedOperation is an OSError
+        return None
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ, "serial")
+    selector.register(command_wakeup_recv, selectors.EVENT_READ, "command_wakeup")
+    log.debug("Registered serial port %s with %s.", serial_port.port, selector.__class__.__name__)
+    return selector
+
+def read_ready_serial(serial_port):
+    # The selector already reported the fd readable, so a single os.read() replaces pyserial's
+    # in_waiting ioctl plus the select() and read loop inside Serial.read()
+    try:
+        data = os.read(serial_port.fileno(), SERIAL_READ_CHUNK)
+    except BlockingIOError:
+        return b""
+    except OSError as e:
+        raise serial.SerialException(f"read failed: {e}")
+    if not data:
+        # Same check as pyserial: a disconnected device stays readable but returns nothing
+        raise serial.SerialException("device reports readiness to read but returned no data (device disconnected?)")
+    return data
+
+def set_serial_buffer_sizes(serial_port):
+    # Only the Windows backend exposes driver queue sizes; the default RX queue is a few KiB
+    if not hasattr(serial_port, "set_buffer_size"):
+        return
+    try:
+        serial_port.set_buffer_size(rx_size=SERIAL_DRIVER_RX_BUFFER, tx_size=SERIAL_DRIVER_TX_BUFFER)
+    except (serial.SerialException, ValueError) as e:
+        log.warning("Could not resize driver buffers for %s: %s", serial_port.port, e)
+
+def drop_pending_commands(reason):
+    # Commands queued for a port that failed or was replaced must not go out on the next one
+    dropped = 0
+    while True:
+        try:
+            command_queue.get_nowait()
+        except queue.Empty:
+            break
+        dropped += 1
+    if dropped:
+        log.warning("Dropped %s unsent command(s): %s", dropped, reason)
+        queue_broadcast("mcu_log", {"type": "error", "message": f"Dropped {dropped} unsent command(s): {reason}"})
+
+def write_pending_commands(serial_port):
+    global status_requested_at
+    while True:
+        try:
+            command_string = command_queue.get_nowait()
+        except queue.Empty:
+            return
+        if command_string == "GET_STATUS":
+            # Several clients connecting at once each ask for status; the STATUS reply is broadcast
+            # to all of them, so one request in flight is enough
+            if status_requested_at is not None and time.monotonic() - status_requested_at < STATUS_REQUEST_COALESCE:
+                log.debug("Skipping GET_STATUS; a STATUS reply is already pending.")
+                continue
+            status_requested_at = time.monotonic()
+        try:
+            serial_port.write((command_string + "\n").encode("utf-8"))
+        except serial.SerialException as e:
+            log.error("SerialException while writing to MCU '%s': %s", command_string, e)
+            queue_broadcast("mcu_log", {"type": "error", "message": f"Error sending command (SerialException): {e}"})
+            drop_pending_commands("sending to the MCU failed")
+            raise
+        log.info("Successfully sent to MCU: %s", command_string)
+        queue_broadcast("mcu_log", {"type": "cmd_sent", "message": f"CMD > {command_string}"})
+        socketio.sleep(COMMAND_SEND_DELAY)
+
+def process_mcu_lines(text, now):
+    # Called once per serial read; the DEBUG check and handler lookup are bound once for the whole chunk,
+    # and every line in it is stamped with the read's receive time.
+    # The chunk arrives decoded in one call: splitting bytes and decoding state/mode per line measured slower.
+    trace = log.isEnabledFor(logging.DEBUG)
+    get_handler = MCU_LINE_HANDLERS.get
+    for line in text.split("\n"):
+        line = line.strip()
+        if trace:
+            log.debug("MCU RAW >> %s", line)
+        if not line:
+            continue
+        # Bounded split: STATUS needs 10 fields, anything beyond stays in the tail
+        parts = line.split(",", 10)
+        handler = get_handler(parts[0])
+        if handler is None or not handler(line, parts, now):
+            queue_mcu_log("unknown", f"MCU_UNKNOWN: {line}")
+
 def serial_reader_thread():
-    global ser, SERIAL_PORT
-    print("INFO: Serial reader thread started.")
+    global ser, SERIAL_PORT, status_requested_at
+    log.info("Serial reader thread started.")
 
     connection_attempt_interval = 5 # seconds
     last_connection_status_update = 0
+    serial_selector = None
+    selected_ser = None # The serial object serial_selector was built for
+    rx_buffer = bytearray() # Bytes received after the last complete line; extended in place
 
     while not shutdown_event.is_set():
+        if serial_reset_requested.is_set():
+            serial_reset_requested.clear()
+            if ser is not None:
+                log.debug("Closing serial connection to %s for port change/reset.", ser.port)
+                try:
+                    ser.close()
+                except Exception as e_close:
+                    log.error("Error closing serial port %s during port change: %s", ser.port, e_close)
+                ser = None
+
         if not SERIAL_PORT:
             if time.time() - last_connection_status_update > 10:
-                socketio.emit("mcu_log", {"type": "error", "message": "Serial port not configured. Please select one."})
-                socketio.emit("serial_port_status", {"status": "error", "message": "Not configured", "port": None})
+                queue_broadcast("mcu_log", {"type": "error", "message": "Serial port not configured. Please select one."})
+                broadcast_serial_port_status("error", "Not configured", None)
                 last_connection_status_update = time.time()
-            time.sleep(connection_attempt_interval)
+            serial_reset_requested.wait(timeout=connection_attempt_interval) # A port selection ends the wait early
             continue
 
         if ser is None or not ser.is_open:
-            with serial_lock:
-                if ser is not None and ser.is_open: # Double check
-                    pass
-                else:
-                    if ser is not None:
-                        try:
-                            ser.close()
-                            print(f"DEBUG: Closed existing non-open serial port object for {SERIAL_PORT}.")
-                        except Exception as e_close:
-                            print(f"ERROR: Error trying to close non-open serial port {SERIAL_PORT}: {e_close}")
-                        ser = None
+            if ser is not None:
+                try:
+                    ser.close()
+                    log.debug("Closed existing non-open serial port object for %s.", SERIAL_PORT)
+                except Exception as e_close:
+                    log.error("Error trying to close non-open serial port %s: %s", SERIAL_PORT, e_close)
+                ser = None
+            drop_pending_commands("the serial connection was lost or changed")
 
-                    try:
-                        print(f"INFO: Attempting to connect to serial port: {SERIAL_PORT} at {BAUD_RATE} baud")
-                        if not SERIAL_PORT: # Guard against empty port name
-                            print(f"ERROR: Serial port name is empty or None. Cannot connect.")
-                            raise serial.SerialException("Serial port name is empty or None.")
-                        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-                        print(f"INFO: Successfully connected to {SERIAL_PORT}.")
-                        socketio.emit("mcu_log", {"type": "success", "message": f"Connected to FermaSense on {SERIAL_PORT}"})
-                        socketio.emit("serial_port_status", {"status": "success", "message": f"Connected to {SERIAL_PORT}", "port": SERIAL_PORT})
-                        send_command_to_mcu("GET_STATUS") # Send GET_STATUS after successful connection
-                        last_connection_status_update = time.time()
-                    except serial.SerialException as e:
-                        ser = None
-                        print(f"ERROR: Serial connection error on {SERIAL_PORT}: {e}")
-                        socketio.emit("mcu_log", {"type": "error", "message": f"Serial connection to {SERIAL_PORT} failed: {e}. Retrying..."})
-                        socketio.emit("serial_port_status", {"status": "error", "message": f"Failed: {e}", "port": SERIAL_PORT})
-                        last_connection_status_update = time.time()
-                    except Exception as e_generic:
-                        ser = None
-                        print(f"ERROR: Generic error during serial connection attempt on {SERIAL_PORT}: {e_generic}")
-                        socketio.emit("mcu_log", {"type": "error", "message": f"Unexpected error connecting to {SERIAL_PORT}: {e_generic}. Retrying..."})
-                        last_connection_status_update = time.time()
+            try:
+                log.info("Attempting to connect to serial port: %s at %s baud", SERIAL_PORT, BAUD_RATE)
+                if not SERIAL_PORT: # Guard against empty port name
+                    log.error("Serial port name is empty or None. Cannot connect.")
+                    raise serial.SerialException("Serial port name is empty or None.")
+                ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=SERIAL_READ_TIMEOUT)
+                set_serial_buffer_sizes(ser)
+                log.info("Successfully connected to %s.", SERIAL_PORT)
+                queue_broadcast("mcu_log", {"type": "success", "message": f"Connected to FermaSense on {SERIAL_PORT}"})
+                broadcast_serial_port_status("success", f"Connected to {SERIAL_PORT}", SERIAL_PORT)
+                send_command_to_mcu("GET_STATUS") # Send GET_STATUS after successful connection
+                last_connection_status_update = time.time()
+            except serial.SerialException as e:
+                ser = None
+                log.error("Serial connection error on %s: %s", SERIAL_PORT, e)
+                queue_broadcast("mcu_log", {"type": "error", "message": f"Serial connection to {SERIAL_PORT} failed: {e}. Retrying..."})
+                broadcast_serial_port_status("error", f"Failed: {e}", SERIAL_PORT)
+                last_connection_status_update = time.time()
+            except Exception as e_generic:
+                ser = None
+                log.error("Generic error during serial connection attempt on %s: %s", SERIAL_PORT, e_generic)
+                queue_broadcast("mcu_log", {"type": "error", "message": f"Unexpected error connecting to {SERIAL_PORT}: {e_generic}. Retrying..."})
+                last_connection_status_update = time.time()
 
             if ser is None or not ser.is_open:
-                time.sleep(connection_attempt_interval)
+                serial_reset_requested.wait(timeout=connection_attempt_interval) # A port selection ends the wait early
                 continue
 
         try:
-            if ser.in_waiting > 0:
-                line_bytes = ser.readline()
-                line = line_bytes.decode("utf-8", errors="ignore").strip()
-                print(f"DEBUG: MCU RAW >> {line}")
-                if line:
-                    timestamp_iso = datetime.now().isoformat()
-                    parts = line.split(",")
-
-                    if parts[0] == "DATA" and len(parts) == 7:
-                        try:
-                            payload = {
-                                "server_time_iso": timestamp_iso,
-                                "mcu_time_s": float(parts[1]),
-                                "current_temp": float(parts[2]),
-                                "set_temp_min": float(parts[3]),
-                                "set_temp_max": float(parts[4]),
-                                "state": parts[5],
-                                "mode": parts[6],
-                            }
-                            socketio.emit("new_data", payload)
-                            log_to_csv(MAIN_LOG_FILE, payload, ["server_time_iso", "mcu_time_s", "current_temp", "set_temp_min", "set_temp_max", "state", "mode"])
-                        except ValueError as e:
-                            print(f"ERROR: Parsing DATA line: {line} - {e}")
-                            socketio.emit("mcu_log", {"type": "error", "message": f"Data parse error: {line}"})
-                    elif parts[0] == "EQUALIZED" and len(parts) == 4:
-                        try:
-                            eq_chart_event = {
-                                "server_time_iso": timestamp_iso,
-                                "target_temp": float(parts[1]), # This is target_temp_min from Arduino
-                                "duration_s": float(parts[3]),
-                            }
-                            socketio.emit("equalization_update", eq_chart_event)
-                            log_to_csv(EQ_LOG_FILE, eq_chart_event, ["server_time_iso", "target_temp", "duration_s"])
-                            socketio.emit("mcu_log", {"type": "info", "message": f"Equalized to {parts[1]}-{parts[2]}°C in {parts[3]}s"})
-                        except ValueError as e:
-                            print(f"ERROR: Parsing EQUALIZED line: {line} - {e}")
-                            socketio.emit("mcu_log", {"type": "error", "message": f"Equalization parse error: {line}"})
-                    elif parts[0] == "STATUS" and len(parts) >= 10: # Ensure enough parts for all fields
+            if selected_ser is not ser:
+                if serial_selector is not None:
+                    serial_selector.close()
+                serial_selector = open_serial_selector(ser)
+                selected_ser = ser
+                rx_buffer.clear()
+                status_requested_at = None # A request to the previous port will never be answered
+
+            if serial_selector is not None:
+                has_data = False
+                for key, _ in serial_selector.select(timeout=SERIAL_SELECT_TIMEOUT):
+                    if key.data == "command_wakeup":
                         try:
-                            status_payload = {
-                                "mcu_time_s": float(parts[1]),
-                                "current_temp": float(parts[2]),
-                                "set_temp_min": float(parts[3]),
-                                "set_temp_max": float(parts[4]),
-                                "state": parts[5],
-                                "mode": parts[6],
-                                "frequency_ms": int(parts[7]),
-                                "is_equalizing": parts[8] == "TIMING_EQ",
-                                "setpoint_change_time_s": float(parts[9]),
-                            }
-                            socketio.emit("initial_status", status_payload)
-                        except Exception as e:
-                            message = f"Error parsing STATUS: {e} (Line: {line})"
-                            print(f"ERROR: {message}")
-                            socketio.emit("mcu_log", {"type": "error", "message": message})
-                    elif parts[0] in ["INFO", "ERROR", "CMD_RECV", "WARN"]:
-                        log_type = parts[0].lower()
-                        socketio.emit("mcu_log", {"type": log_type, "message": line})
+                            command_wakeup_recv.recv(4096)
+                        except BlockingIOError:
+                            pass
                     else:
-                        socketio.emit("mcu_log", {"type": "unknown", "message": f"MCU_UNKNOWN: {line}"})
+                        has_data = True
             else:
-                time.sleep(0.05)
+                # No selectable fd (Windows). A real thread can let the read timeout do the waiting;
+                # a green thread must not block inside the driver, so it polls in_waiting instead.
+                has_data = ser.in_waiting > 0 or ASYNC_MODE == "threading"
+
+            write_pending_commands(ser)
+
+            if has_data:
+                # Read everything the OS has buffered in one call and keep any partial line for next time
+                chunk = read_ready_serial(ser) if serial_selector is not None else ser.read(ser.in_waiting or 1)
+                rx_buffer += chunk
+                # The carried-over partial line has no newline, so only the new bytes need searching
+                line_end = rx_buffer.rfind(b"\n", len(rx_buffer) - len(chunk))
+                if line_end >= 0:
+                    complete = rx_buffer[:line_end].decode("utf-8", errors="ignore")
+                    del rx_buffer[:line_end + 1]
+                    process_mcu_lines(complete, time.time())
+                elif len(rx_buffer) > SERIAL_RX_MAX_LINE:
+                    log.warning("Discarding %s bytes from MCU without a line ending.", len(rx_buffer))
+                    rx_buffer.clear()
+            elif serial_selector is None:
+                socketio.sleep(0.05)
         except serial.SerialException as e:
-            print(f"ERROR: Serial communication error during read on {SERIAL_PORT}: {e}")
-            socketio.emit("mcu_log", {"type": "error", "message": f"Serial Port Error: {e}. Connection lost."})
-            socketio.emit("serial_port_status", {"status": "error", "message": f"Disconnected: {e}", "port": SERIAL_PORT})
-            with serial_lock:
-                if ser:
-                    try:
-                        ser.close()
-                    except Exception as e_close:
-                        print(f"ERROR: Error closing serial port on read error: {e_close}")
-                ser = None
+            log.error("Serial communication error during read on %s: %s", SERIAL_PORT, e)
+            queue_broadcast("mcu_log", {"type": "error", "message": f"Serial Port Error: {e}. Connection lost."})
+            broadcast_serial_port_status("error", f"Disconnected: {e}", SERIAL_PORT)
+            if ser:
+                try:
+                    ser.close()
+                except Exception as e_close:
+                    log.error("Error closing serial port on read error: %s", e_close)
+            ser = None
             last_connection_status_update = time.time()
-            time.sleep(connection_attempt_interval / 2)
+            socketio.sleep(connection_attempt_interval / 2)
         except Exception as e: # Catch other unexpected errors during read loop
-            print(f"ERROR: Unexpected error in serial_reader_thread loop: {e.__class__.__name__}: {e}")
-            socketio.emit("mcu_log", {"type": "error", "message": f"Backend processing error: {e}"})
-            time.sleep(1)
+            log.error("Unexpected error in serial_reader_thread loop: %s: %s", e.__class__.__name__, e)
+            queue_broadcast("mcu_log", {"type": "error", "message": f"Backend processing error: {e}"})
+            socketio.sleep(1)
 
-    print("INFO: Serial reader thread stopping...")
-    with serial_lock:
-        if ser and ser.is_open:
-            try:
-                ser.close()
-                print("INFO: Serial port closed by shutdown.")
-            except Exception as e_close_shutdown:
-                print(f"ERROR: Error closing serial port during shutdown: {e_close_shutdown}")
-        ser = None
-    print("INFO: Serial reader thread stopped.")
+    log.info("Serial reader thread stopping...")
+    if serial_selector is not None:
+        serial_selector.close()
+    csv_row_queue.put(None) # Rows from this thread are all queued; let the writer drain and close the logs
+    if ser and ser.is_open:
+        try:
+            ser.close()
+            log.info("Serial port closed by shutdown.")
+        except Exception as e_close_shutdown:
+            log.error("Error closing serial port during shutdown: %s", e_close_shutdown)
+    ser = None
+    log.info("Serial reader thread stopped.")
+    serial_reader_stopped.set()
 
 
 # --- Flask Routes ---
@@ -252,128 +969,380 @@ def index():
 def send_command_route():
     command_str = request.form.get("command")
     if not command_str:
-        return jsonify({"status": "error", "message": "No command provided."}), 400
+        return json_response({"status": "error", "message": "No command provided."}, 400)
 
     if send_command_to_mcu(command_str):
-        return jsonify({"status": "success", "message": f'Command "{command_str}" sent.'})
+        return json_response({"status": "success", "message": f'Command "{command_str}" sent.'})
     else:
-        return jsonify({"status": "error", "message": "Failed to send command. MCU not connected or error."}), 500
+        return json_response({"status": "error", "message": "Failed to send command. MCU not connected or error."}, 500)
+
+def wake_serial_reader():
+    try:
+        command_wakeup_send.send(b"\0")
+    except (BlockingIOError, OSError):
+        pass # Wakeup already pending
 
 def send_command_to_mcu(command_string):
-    global ser
-    print(f"DEBUG: send_command_to_mcu CALLED with command: {command_string}")
-    acquired_lock = False
-    success = False 
+    # Queue the command for serial_reader_thread; it owns the port and writes between reads
+    if not (ser and ser.is_open):
+        log.error("Cannot send command '%s'. Serial port unavailable.", command_string)
+        broadcast("mcu_log", {"type": "error", "message": "Cannot send command: Serial port unavailable."})
+        return False
+    command_queue.put(command_string)
+    wake_serial_reader()
+    log.debug("Queued command for MCU: %s", command_string)
+    return True
+
+
+def iter_caching(chunks, file_path, key):
+    # Passes a streamed body through, keeping a copy for history_cache unless it grows too large
+    kept = []
+    size = 0
     try:
-        print(f"DEBUG: send_command_to_mcu '{command_string}' attempting to acquire serial_lock...")
-        acquired_lock = serial_lock.acquire(timeout=2) 
-        if not acquired_lock:
-            print(f"ERROR: send_command_to_mcu '{command_string}' FAILED to acquire serial_lock within 2s timeout.")
-            socketio.emit("mcu_log", {"type": "error", "message": f"Internal server error: Lock timeout sending {command_string}"})
-            return False
+        for chunk in chunks:
+            if kept is not None:
+                size += len(chunk)
+                if size <= HISTORY_CACHE_MAX_BYTES:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+    finally:
+        chunks.close() # Closes the CSV even if the client goes away mid-stream
+    if kept is not None:
+        store_history(file_path, key, b"".join(kept), ndjson=True)
 
-        print(f"DEBUG: send_command_to_mcu '{command_string}' acquired serial_lock.")
+def ndjson_chunk(points):
+    # One orjson call per chunk: the points hold only numbers, so "},{" only ever occurs between objects
+    return orjson.dumps(points)[1:-1].replace(b"},{", b"}\n{") + b"\n"
 
-        if ser and ser.is_open:
-            print(f"DEBUG: send_command_to_mcu '{command_string}' - ser object exists and is_open (Port: {ser.port}).")
+def iter_historical_data_ndjson(csvfile, reader, parse, since=None):
+    # Yields the chart points as NDJSON (one object per line), HISTORY_STREAM_CHUNK_ROWS points per chunk,
+    # so the response starts immediately, memory stays bounded and the client can parse as it arrives.
+    # Points older than `since` (epoch ms) are skipped. Points are collected as objects and encoded a chunk
+    # at a time by ndjson_chunk; an orjson call per point costs about a third of the whole stream.
+    try:
+        chunk = []
+        for row in reader:
             try:
-                ser.write((command_string + "\n").encode("utf-8"))
-                print(f"INFO: Successfully sent to MCU: {command_string}")
-                socketio.emit("mcu_log", {"type": "cmd_sent", "message": f"CMD > {command_string}"})
-                success = True
-                return True
-            except serial.SerialException as e:
-                print(f"ERROR: SerialException while writing to MCU '{command_string}': {e}")
-                socketio.emit("mcu_log", {"type": "error", "message": f"Error sending command (SerialException): {e}"})
-                return False
-            except Exception as e:
-                print(f"ERROR: Generic error writing to MCU '{command_string}': {e}")
-                socketio.emit("mcu_log", {"type": "error", "message": f"Error sending command (Exception): {e}"})
-                return False
-        else:
-            if ser:
-                 print(f"ERROR: Cannot send command '{command_string}'. Serial port {ser.port} exists but is NOT OPEN.")
-            else:
-                 print(f"ERROR: Cannot send command '{command_string}'. Serial port object (ser) is None.")
-            socketio.emit("mcu_log", {"type": "error", "message": "Cannot send command: Serial port unavailable."})
-            return False
+                point = parse(row)
+            except (ValueError, IndexError) as e:
+                log.debug("Skipping malformed row in main CSV: %s - %s", row, e)
+                continue
+            if since is not None and point[0] < since:
+                continue
+            chunk.append(history_point_json(point))
+            if len(chunk) >= HISTORY_STREAM_CHUNK_ROWS:
+                yield ndjson_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield ndjson_chunk(chunk)
     finally:
-        if acquired_lock:
-            serial_lock.release()
-            print(f"DEBUG: send_command_to_mcu '{command_string}' released serial_lock.")
-        if success: 
-            time.sleep(COMMAND_SEND_DELAY)
+        csvfile.close()
 
+def block_starts_before(chunk, ts_i, since):
+    # True when the first complete row in a block read from the back of the log is older than `since` (epoch ms)
+    start = chunk.find(b"\n") + 1
+    end = chunk.find(b"\n", start)
+    if start == 0 or end < 0:
+        return False
+    row = next(csv.reader([chunk[start:end].decode("utf-8", errors="replace")]), None)
+    try:
+        return int(row[ts_i]) < since
+    except (TypeError, ValueError, IndexError):
+        return False
+
+def read_csv_tail(file_path, limit=None):
+    # Returns (fieldnames, rows) for the last `limit` rows of a CSV log, or all rows when limit is None.
+    # With a limit only the end of the file is read, CSV_TAIL_READ_BLOCK bytes at a time from the back.
+    with open(file_path, "rb") as f:
+        fieldnames = next(csv.reader([f.readline().decode("utf-8", errors="replace")]), None)
+        data_start = f.tell()
+        pos = f.seek(0, os.SEEK_END)
+        chunks = []
+        newlines = 0
+        while pos > data_start and (limit is None or newlines <= limit):
+            step = pos - data_start if limit is None else min(CSV_TAIL_READ_BLOCK, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    lines = b"".join(reversed(chunks)).decode("utf-8", errors="replace").splitlines()
+    if pos > data_start:
+        lines = lines[1:] # Partial first line; the read started mid-row
+    if limit is not None:
+        lines = lines[-limit:] if limit > 0 else []
+    return fieldnames, csv.reader(lines)
+
+def open_csv_since(file_path, since):
+    # Returns (fieldnames, csvfile) with csvfile open at a row boundary at or before the first row from
+    # `since` (epoch ms) on. The backwards scan only looks at one CSV_TAIL_READ_BLOCK at a time, and the
+    # rows themselves are read forwards as the caller consumes them; it drops the few older ones.
+    f = open(file_path, "rb")
+    try:
+        fieldnames = next(csv.reader([f.readline().decode("utf-8", errors="replace")]), None)
+        ts_i = fieldnames.index("ts_ms") if fieldnames and "ts_ms" in fieldnames else None
+        data_start = f.tell()
+        pos = f.seek(0, os.SEEK_END) if ts_i is not None else data_start
+        while pos > data_start:
+            step = min(CSV_TAIL_READ_BLOCK, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            if block_starts_before(f.read(step), ts_i, since):
+                break
+        f.seek(pos)
+        csvfile = io.TextIOWrapper(f, encoding="utf-8", errors="replace", newline="")
+    except BaseException:
+        f.close()
+        raise
+    if pos > data_start:
+        csvfile.readline() # Partial first line; the block started mid-row
+    return fieldnames, csvfile
+
+def read_csv_items(file_path, required_fields, make_parser, limit=None):
+    fieldnames, rows = read_csv_tail(file_path, limit)
+    if fieldnames is None or not all(f in fieldnames for f in required_fields):
+        log.warning("CSV log (%s) header mismatch or missing. Fields: %s", file_path, fieldnames)
+        return [] # Return empty if headers are bad
+    parse = make_parser(fieldnames)
+    items = []
+    for row in rows:
+        try:
+            items.append(parse(row))
+        except (ValueError, IndexError) as e:
+            log.debug("Skipping malformed row in %s: %s - %s", file_path, row, e)
+    return items
+
+def serve_csv_tail(file_path, required_fields, make_parser, limit=None):
+    if limit is not None:
+        # The newest `limit` items, walking back into the rotated logs while the newer ones hold fewer
+        items = []
+        for segment_path in reversed(log_segments(file_path)):
+            if len(items) >= limit:
+                break
+            try:
+                items[:0] = read_csv_items(segment_path, required_fields, make_parser, limit - len(items))
+            except FileNotFoundError:
+                continue # Rotated away since it was listed
+        return json_response(items)
+    try:
+        key, body = cached_history(file_path)
+    except FileNotFoundError:
+        return json_response([]) # Nothing logged yet
+    if body is not None:
+        return Response(body, mimetype="application/json")
+    if key[1] == 0:
+        return json_response([])
+    response = json_response(read_csv_items(file_path, required_fields, make_parser))
+    store_history(file_path, key, response.get_data())
+    return response
+
+def history_point_json_parser(fieldnames):
+    parse = history_point_parser(fieldnames)
+    return lambda row: history_point_json(parse(row))
+
+def equalization_event_parser(fieldnames):
+    iso_i, target_i, duration_i = (fieldnames.index(f) for f in EQ_REQUIRED_FIELDS)
+    ts_i = fieldnames.index("ts_ms") if "ts_ms" in fieldnames else None
+    def parse(row):
+        ts_ms = row[ts_i] if ts_i is not None and ts_i < len(row) else None
+        return {
+            "server_time_iso": row[iso_i],
+            "target_temp": float(row[target_i]),
+            "duration_s": float(row[duration_i]),
+            # Logs written before the ts_ms column existed fall back to the ISO timestamp
+            "ts_ms": int(ts_ms) if ts_ms else int(datetime.fromisoformat(row[iso_i]).timestamp() * 1000),
+        }
+    return parse
+
+def accepts_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+def iter_gzip(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits 31: gzip container
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close() # Lets a wrapped generator release its file if the client goes away
+    yield compressor.flush()
+
+def iter_file(file_path):
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(LOG_DOWNLOAD_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+def gzip_response(response, chunks, level):
+    # Replaces the body with a gzip stream of `chunks`, compressed as it is sent
+    response.response = iter_gzip(chunks, level)
+    response.direct_passthrough = False
+    response.headers.pop("Content-Length", None)
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+def history_response(chunks):
+    if accepts_gzip():
+        return gzip_response(Response(mimetype="application/x-ndjson"), chunks, HISTORY_GZIP_LEVEL)
+    return Response(chunks, mimetype="application/x-ndjson")
+
+def rotated_logs(file_path):
+    # Logs set aside by CsvBatchWriter.rotate, newest first; the timestamp suffix sorts chronologically
+    stem, ext = os.path.splitext(file_path)
+    return sorted(glob.glob(f"{glob.escape(stem)}.*{ext}"), reverse=True)
+
+def log_segments(file_path):
+    # Oldest first: the rotated logs, then the current one unless a rotation has just set it aside
+    segments = rotated_logs(file_path)[::-1]
+    if os.path.exists(file_path):
+        segments.append(file_path)
+    return segments
+
+def iter_log_segments_ndjson(paths):
+    # Streams each main log segment in turn as NDJSON; a segment with a bad header is skipped
+    for file_path in paths:
+        try:
+            csvfile = open(file_path, "r", newline="", encoding="utf-8")
+        except FileNotFoundError:
+            continue # Rotated away since it was listed
+        reader = csv.reader(csvfile)
+        fieldnames = next(reader, None)
+        if fieldnames is None or not all(f in fieldnames for f in MAIN_REQUIRED_FIELDS):
+            log.warning("Main log CSV (%s) header mismatch or missing. Fields: %s", file_path, fieldnames)
+            csvfile.close()
+            continue
+        yield from iter_historical_data_ndjson(csvfile, reader, history_point_parser(fieldnames))
+
+def iter_log_segments_csv(paths):
+    # The log segments as one CSV, oldest first; only the first segment read keeps its header row
+    header_sent = False
+    for file_path in paths:
+        try:
+            f = open(file_path, "rb")
+        except FileNotFoundError:
+            continue
+        with f:
+            if header_sent:
+                f.readline()
+            header_sent = True
+            while True:
+                chunk = f.read(LOG_DOWNLOAD_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+
+def read_history_since(since):
+    # Returns (parser, csvfile, reader) per main log segment, oldest first, with each log open at the start
+    # of the window. The rotated logs act as a coarse time index: older ones are only opened while the newer
+    # segments don't yet reach back to `since`, which takes parsing just the first row of each window.
+    segments = []
+    try:
+        for file_path in [MAIN_LOG_FILE, *rotated_logs(MAIN_LOG_FILE)]:
+            try:
+                fieldnames, csvfile = open_csv_since(file_path, since)
+            except FileNotFoundError:
+                continue # Between a rotation and the next flush there is no current log
+            if fieldnames is None or not all(f in fieldnames for f in MAIN_REQUIRED_FIELDS):
+                log.warning("Main log CSV (%s) header mismatch or missing. Fields: %s", file_path, fieldnames)
+                csvfile.close()
+                continue
+            parse = history_point_parser(fieldnames)
+            first_line = csvfile.readline()
+            lines = itertools.chain([first_line], csvfile) if first_line else csvfile
+            segments.append((parse, csvfile, csv.reader(lines)))
+            try:
+                first_row = next(csv.reader([first_line]), None)
+                if first_row and parse(first_row)[0] < since:
+                    break
+            except (ValueError, IndexError):
+                pass
+    except BaseException:
+        for _, csvfile, _ in segments:
+            csvfile.close()
+        raise
+    segments.reverse()
+    return segments
+
+def iter_history_since_ndjson(segments, since):
+    try:
+        for parse, csvfile, reader in segments:
+            yield from iter_historical_data_ndjson(csvfile, reader, parse, since)
+    finally:
+        for _, csvfile, _ in segments:
+            csvfile.close() # The segments not reached yet if the client went away mid-stream
+
+def history_since_response(since):
+    # Snapshot the deque first: in threading mode the serial reader appends to it while we filter
+    recent = list(recent_history)
+    if recent and recent[0][0] <= since:
+        points = [history_point_json(point) for point in recent if point[0] >= since]
+        return history_response([ndjson_chunk(points)] if points else [])
+    try:
+        segments = read_history_since(since)
+    except (OSError, ValueError) as e:
+        log.error("Error reading historical data: %s", e)
+        return json_response({"error": str(e)}, 500)
+    return history_response(iter_history_since_ndjson(segments, since))
 
 @app.route("/get_historical_data", methods=["GET"])
 def get_historical_data_route():
+    # Without arguments the in-memory tail is returned; ?full=1 streams the whole CSV as NDJSON,
+    # ?from=<epoch ms> (what the chart asks for) streams the points since then as NDJSON, from memory when
+    # it reaches back that far, and ?limit=N returns the newest N points, from the CSV tail if memory doesn't hold that many
+    limit = request.args.get("limit", type=int)
+    full = request.args.get("full") == "1"
+    since = request.args.get("from", type=int)
+    if since is not None and not full:
+        return history_since_response(since)
+    if limit is not None:
+        limit = max(limit, 0)
+    if not full and (limit is None or limit <= len(recent_history)):
+        points = list(recent_history)
+        if limit is not None:
+            points = points[len(points) - limit:]
+        return json_response([history_point_json(point) for point in points])
     try:
-        ensure_dir_exists(DATA_DIR)
-        data_points = []
-        if os.path.exists(MAIN_LOG_FILE):
-            # Check if file is empty, if so, return empty list to avoid DictReader error on empty file
-            if os.path.getsize(MAIN_LOG_FILE) == 0:
-                return jsonify(data_points)
-                
-            with open(MAIN_LOG_FILE, "r", newline="", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                # Basic check for expected fieldnames if reader.fieldnames is not None
-                expected_main_fieldnames = ["server_time_iso", "mcu_time_s", "current_temp", "set_temp_min", "set_temp_max", "state", "mode"]
-                if reader.fieldnames is None or not all(f in reader.fieldnames for f in expected_main_fieldnames[:3]): # Check a few core fields
-                    print(f"WARNING: Main log CSV ({MAIN_LOG_FILE}) header mismatch or missing. Fields: {reader.fieldnames}")
-                    # Potentially return empty or log an error to frontend
-                    return jsonify(data_points) # Return empty if headers are bad
-
-                for row in reader:
-                    try:
-                        dt_obj = datetime.fromisoformat(row["server_time_iso"])
-                        data_points.append({
-                            "x": dt_obj.timestamp() * 1000,
-                            "current_temp": float(row["current_temp"]),
-                            "set_temp_min": float(row["set_temp_min"]),
-                            "set_temp_max": float(row["set_temp_max"]),
-                        })
-                    except (ValueError, KeyError) as e:
-                        print(f"DEBUG: Skipping malformed row in main CSV: {row} - {e}")
-        return jsonify(data_points)
+        if limit is not None:
+            return serve_csv_tail(MAIN_LOG_FILE, MAIN_REQUIRED_FIELDS, history_point_json_parser, limit)
+
+        segments = log_segments(MAIN_LOG_FILE)
+        if not segments:
+            return Response(b"", mimetype="application/x-ndjson") # Nothing logged yet
+        # The cache is keyed on the current log, which a rotation always replaces; while there is
+        # no current log the rotated ones are streamed without caching
+        try:
+            key, body = cached_history(MAIN_LOG_FILE)
+        except FileNotFoundError:
+            key, body = None, None
+        if body is not None:
+            return history_response([body])
+
+        chunks = iter_log_segments_ndjson(segments)
+        if key is not None:
+            chunks = iter_caching(chunks, MAIN_LOG_FILE, key)
+        return history_response(chunks)
     except Exception as e:
-        print(f"ERROR: Error reading historical data: {e}")
-        return jsonify({"error": str(e)}), 500
+        log.error("Error reading historical data: %s", e)
+        return json_response({"error": str(e)}, 500)
 
 @app.route("/get_equalization_log", methods=["GET"])
 def get_equalization_log_route():
+    limit = request.args.get("limit", type=int)
     try:
-        ensure_dir_exists(DATA_DIR)
-        eq_events = []
-        if os.path.exists(EQ_LOG_FILE):
-            # Check if file is empty
-            if os.path.getsize(EQ_LOG_FILE) == 0:
-                return jsonify(eq_events)
-
-            with open(EQ_LOG_FILE, "r", newline="", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                expected_eq_fieldnames = ["server_time_iso", "target_temp", "duration_s"]
-                if reader.fieldnames is None or not all(f in reader.fieldnames for f in expected_eq_fieldnames):
-                    print(f"WARNING: Equalization log CSV ({EQ_LOG_FILE}) header mismatch or missing. Fields: {reader.fieldnames}")
-                    return jsonify(eq_events)
-
-                for row in reader:
-                    try:
-                        eq_events.append({
-                            "server_time_iso": row["server_time_iso"],
-                            "target_temp": float(row["target_temp"]),
-                            "duration_s": float(row["duration_s"]),
-                        })
-                    except (ValueError, KeyError) as e:
-                        print(f"DEBUG: Skipping malformed row in equalization CSV: {row} - {e}")
-        return jsonify(eq_events)
+        return serve_csv_tail(EQ_LOG_FILE, EQ_REQUIRED_FIELDS, equalization_event_parser, None if limit is None else max(limit, 0))
     except Exception as e:
-        print(f"ERROR: Error reading equalization log: {e}")
-        return jsonify({"error": str(e)}), 500
+        log.error("Error reading equalization log: %s", e)
+        return json_response({"error": str(e)}, 500)
 
 @app.route("/download_log/<log_type>")
 def download_log_route(log_type):
-    ensure_dir_exists(DATA_DIR)
     file_path = ""
     download_name = ""
     if log_type == "main":
@@ -385,30 +1354,54 @@ def download_log_route(log_type):
     else:
         return "Invalid log type", 404
 
-    if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True, download_name=download_name, mimetype="text/csv")
-    else:
-        socketio.emit("mcu_log", {"type": "error", "message": f"{log_type.capitalize()} log file not found."})
+    # Once the log has been rotated the download is the segments joined into one CSV, streamed as it is read
+    segments = log_segments(file_path)
+    if segments and segments != [file_path]:
+        if accepts_gzip():
+            response = gzip_response(Response(mimetype="text/csv"), iter_log_segments_csv(segments), LOG_DOWNLOAD_GZIP_LEVEL)
+        else:
+            response = Response(iter_log_segments_csv(segments), mimetype="text/csv")
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+        return response
+
+    # DATA_DIR is relative to the working directory, while Flask would resolve it against the app root.
+    # send_from_directory stats the file anyway, so a missing log is caught here rather than checked first.
+    try:
+        response = send_from_directory(os.path.abspath(DATA_DIR), os.path.basename(file_path), as_attachment=True,
+                                       download_name=download_name, mimetype="text/csv", conditional=True)
+    except NotFound:
         return f"{log_type.capitalize()} log file not found.", 404
+    # Full downloads are gzipped on the fly; 304s and range requests are left as Flask built them
+    if response.status_code == 200 and accepts_gzip():
+        response.close()
+        gzip_response(response, iter_file(file_path), LOG_DOWNLOAD_GZIP_LEVEL)
+        response.headers.pop("Accept-Ranges", None)
+        etag, _ = response.get_etag()
+        if etag:
+            response.set_etag(etag, weak=True) # Same file, different encoding
+    return response
 
 # --- SocketIO Events ---
 @socketio.on("connect")
 def on_connect():
+    global last_serial_port_status
     client_sid = request.sid
-    print(f"INFO: Web client connected: {client_sid}")
+    connected_clients.add(client_sid)
+    last_serial_port_status = None # This client gets its own status below; let the next change through
+    log.info("Web client connected: %s", client_sid)
     emit("mcu_log", {"type": "info", "message": "Web client connected. Initializing..."})
 
-    print(f"DEBUG: on_connect for SID {client_sid} - Checking ser status before GET_STATUS.")
+    log.debug("on_connect for SID %s - Checking ser status before GET_STATUS.", client_sid)
     if ser and ser.is_open:
-         print(f"DEBUG: on_connect for SID {client_sid} - ser is open (Port: {ser.port}), calling send_command_to_mcu('GET_STATUS').")
+         log.debug("on_connect for SID %s - ser is open (Port: %s), calling send_command_to_mcu('GET_STATUS').", client_sid, ser.port)
          send_command_to_mcu("GET_STATUS")
     else:
         if not ser:
-            print(f"DEBUG: on_connect for SID {client_sid} - ser is None. Not sending GET_STATUS from on_connect.")
+            log.debug("on_connect for SID %s - ser is None. Not sending GET_STATUS from on_connect.", client_sid)
         elif not ser.is_open: 
-            print(f"DEBUG: on_connect for SID {client_sid} - ser is not open (Port: {ser.port if hasattr(ser, 'port') else 'N/A'}). Not sending GET_STATUS from on_connect.")
+            log.debug("on_connect for SID %s - ser is not open (Port: %s). Not sending GET_STATUS from on_connect.", client_sid, ser.port if hasattr(ser, 'port') else 'N/A')
 
-    emit("available_serial_ports", get_available_serial_ports())
+    emit("available_serial_ports", serial_ports_frame(get_available_serial_ports()))
 
     if SERIAL_PORT:
         current_port_status = "unknown"
@@ -422,87 +1415,99 @@ def on_connect():
         else: 
             current_port_status = "error"
             current_port_message = f"Port {SERIAL_PORT} selected, but not connected (ser exists but not open)."
-        emit("serial_port_status", {"status": current_port_status, "message": current_port_message, "port": SERIAL_PORT})
+        emit("serial_port_status", serial_port_status_frame(current_port_status, current_port_message, SERIAL_PORT))
     else:
-        emit("serial_port_status", {"status": "error", "message": "No serial port configured.", "port": None})
+        emit("serial_port_status", serial_port_status_frame("error", "No serial port configured.", None))
 
 
 @socketio.on("disconnect")
 def on_disconnect():
     client_sid = request.sid
-    print(f"INFO: Web client disconnected: {client_sid}")
+    connected_clients.discard(client_sid)
+    log.info("Web client disconnected: %s", client_sid)
 
 @socketio.on("request_serial_ports")
 def handle_request_serial_ports():
-    print("DEBUG: Received request_serial_ports event.")
-    emit("available_serial_ports", get_available_serial_ports())
+    log.debug("Received request_serial_ports event.")
+    emit("available_serial_ports", serial_ports_frame(get_available_serial_ports()))
 
 @socketio.on("set_serial_port")
 def handle_set_serial_port(data):
     global SERIAL_PORT, ser
     new_port_selection = data.get("port")
-    print(f"DEBUG: Received set_serial_port event with port: {new_port_selection}")
+    log.debug("Received set_serial_port event with port: %s", new_port_selection)
 
-    with serial_lock:
-        previous_port = SERIAL_PORT
+    previous_port = SERIAL_PORT
 
-        if new_port_selection == "":
-            ports = get_available_serial_ports()
-            SERIAL_PORT = ports[0] if ports else None
-            message = f"Auto-detecting. Selected: {SERIAL_PORT}" if SERIAL_PORT else "Auto-detect: No ports found."
-        else:
-            SERIAL_PORT = new_port_selection
-            message = f"Serial port explicitly set to: {SERIAL_PORT}"
-
-        print(f"INFO: {message}")
-        socketio.emit("mcu_log", {"type": "info", "message": message})
-
-        needs_reset = False
-        if SERIAL_PORT != previous_port:
-            needs_reset = True
-        elif SERIAL_PORT is not None and (ser is None or (hasattr(ser, 'port') and ser.port != SERIAL_PORT)):
-            needs_reset = True
-
-        if needs_reset:
-            print(f"DEBUG: Port change or need for reset detected. Old: {previous_port}, New: {SERIAL_PORT}. Resetting serial connection.")
-            if ser and ser.is_open:
-                print(f"DEBUG: Closing current serial connection to {ser.port if hasattr(ser, 'port') else 'N/A'} due to port change/reset.")
-                try:
-                    ser.close()
-                except Exception as e_close:
-                    print(f"ERROR: Error closing serial port {ser.port if hasattr(ser, 'port') else 'N/A'} during port change: {e_close}")
-            ser = None 
+    if new_port_selection == "":
+        SERIAL_PORT = get_auto_detect_serial_port()
+        message = f"Auto-detecting. Selected: {SERIAL_PORT}" if SERIAL_PORT else "Auto-detect: No ports found."
+    else:
+        SERIAL_PORT = new_port_selection
+        message = f"Serial port explicitly set to: {SERIAL_PORT}"
+
+    log.info(message)
+    broadcast("mcu_log", {"type": "info", "message": message})
+
+    needs_reset = False
+    if SERIAL_PORT != previous_port:
+        needs_reset = True
+    elif SERIAL_PORT is not None and (ser is None or (hasattr(ser, 'port') and ser.port != SERIAL_PORT)):
+        needs_reset = True
+
+    if needs_reset:
+        log.debug("Port change or need for reset detected. Old: %s, New: %s. Resetting serial connection.", previous_port, SERIAL_PORT)
+        # The reader thread owns the port; it closes it and reconnects to SERIAL_PORT on its next pass
+        serial_reset_requested.set()
+        wake_serial_reader()
 
+    if SERIAL_PORT != previous_port:
         save_config()
 
-        if SERIAL_PORT:
-            if ser and ser.is_open and ser.port == SERIAL_PORT:
-                 emit("serial_port_status", {"status": "success", "message": f"Connected to {SERIAL_PORT}", "port": SERIAL_PORT})
-            else:
-                 emit("serial_port_status", {"status": "info", "message": f"Attempting to use {SERIAL_PORT}", "port": SERIAL_PORT})
-        else: 
-            emit("serial_port_status", {"status": "error", "message": "No port selected/available", "port": None})
+    if SERIAL_PORT:
+        if ser and ser.is_open and ser.port == SERIAL_PORT:
+             emit("serial_port_status", serial_port_status_frame("success", f"Connected to {SERIAL_PORT}", SERIAL_PORT))
+        else:
+             emit("serial_port_status", serial_port_status_frame("info", f"Attempting to use {SERIAL_PORT}", SERIAL_PORT))
+    else: 
+        emit("serial_port_status", serial_port_status_frame("error", "No port selected/available", None))
 
 
 if __name__ == "__main__":
     ensure_dir_exists(DATA_DIR)
     load_config()
+    seed_recent_history()
+
+    socketio.start_background_task(serial_reader_thread)
+    socketio.start_background_task(emit_flusher_thread)
+    socketio.start_background_task(csv_writer_thread)
 
-    serial_thread = threading.Thread(target=serial_reader_thread, daemon=True)
-    serial_thread.start()
+    # A service manager stops us with SIGTERM; turn it into SystemExit so the shutdown below still
+    # drains the CSV writer queue and closes the logs instead of dropping the unflushed tail
+    if ASYNC_MODE == "eventlet":
+        # The handler runs in whichever greenlet was executing, e.g. the serial reader, which must not be
+        # the one to exit; hand the SystemExit to the main greenlet through the hub instead
+        main_greenlet = eventlet.getcurrent()
+        hub = eventlet.hubs.get_hub()
+        signal.signal(signal.SIGTERM, lambda signum, frame: hub.schedule_call_global(0, main_greenlet.throw, SystemExit(0)))
+    else:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    print(f"INFO: Starting FermaSense Web Dashboard on http://localhost:5000")
+    log.info("Starting FermaSense Web Dashboard on http://localhost:5000 (async_mode=%s)", ASYNC_MODE)
     try:
         socketio.run(app, host="0.0.0.0", port=5000, debug=False, allow_unsafe_werkzeug=True)
     finally:
-        print("INFO: Shutting down FermaSense server...")
+        log.info("Shutting down FermaSense server...")
         shutdown_event.set()
-        if serial_thread.is_alive():
-            print("INFO: Waiting for serial_reader_thread to finish...")
-            serial_thread.join(timeout=5)
-            if serial_thread.is_alive():
-                print("WARNING: Serial reader thread did not finish in time.")
-            else:
-                print("INFO: Serial reader thread finished.")
-        print("INFO: Shutdown complete.")
+        serial_reset_requested.set() # Cut short a reconnect wait
+        wake_serial_reader() # and a select() wait
+        log.info("Waiting for serial_reader_thread to finish...")
+        if serial_reader_stopped.wait(timeout=5):
+            log.info("Serial reader thread finished.")
+        else:
+            log.warning("Serial reader thread did not finish in time.")
+        emit_flusher_stopped.wait(timeout=MCU_LOG_SUPPRESSED_SUMMARY_INTERVAL + 1)
+        if not csv_writer_stopped.wait(timeout=5):
+            log.warning("CSV writer thread did not finish in time.")
+        log.info("Shutdown complete.")
 
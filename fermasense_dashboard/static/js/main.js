@@ -188,7 +188,10 @@ socket.on("disconnect", () =>
   addLogMessage("Disconnected from FermaSense server.", "error")
 );
 
-socket.on("new_data", (data) => {
+// Live DATA rows arrive batched (one frame per ~100 ms on the server side).
+socket.on("new_data_batch", (batch) => {
+  if (!batch.length) return;
+  const data = batch[batch.length - 1];
   mcuTimeEl.textContent = parseFloat(data.mcu_time_s).toFixed(2);
   currentTempEl.textContent = `${parseFloat(data.current_temp).toFixed(1)} °C`;
   setTempRangeEl.textContent = `${parseFloat(data.set_temp_min).toFixed(
@@ -199,14 +202,15 @@ socket.on("new_data", (data) => {
   updateStateIndicator(data.state);
   updateUIMode(data.mode); // Ensure UI mode reflects actual MCU mode
 
-  const timestamp = new Date(data.server_time_iso).getTime();
   if (temperatureChart) {
-    addDataToTemperatureChartStore(
-      timestamp,
-      data.current_temp,
-      data.set_temp_min,
-      data.set_temp_max
-    );
+    batch.forEach((point) => {
+      addDataToTemperatureChartStore(
+        point.ts_ms,
+        point.current_temp,
+        point.set_temp_min,
+        point.set_temp_max
+      );
+    });
     if (chartTimeRangeSelect.value.startsWith("live_")) {
       pruneChartDataStore();
       filterAndApplyDataToChart(
@@ -260,9 +264,8 @@ socket.on("equalization_update", (data) => {
     data.server_time_iso
   ).toLocaleTimeString()})`;
   if (equalizationChart) {
-    const timestamp = new Date(data.server_time_iso).getTime();
     const newDataPoint = {
-      x: timestamp,
+      x: data.ts_ms,
       y: parseFloat(data.duration_s),
       target_temp: parseFloat(data.target_temp),
     };
@@ -280,6 +283,9 @@ socket.on("equalization_update", (data) => {
 });
 
 socket.on("mcu_log", (log) => addLogMessage(log.message, log.type));
+socket.on("mcu_log_batch", (logs) =>
+  logs.forEach((log) => addLogMessage(log.message, log.type))
+);
 
 socket.on("available_serial_ports", (ports) => {
   const currentSelected = serialPortSelect.value;
@@ -500,6 +506,12 @@ function updateChartDisplayRange() {
       chartStartDateInput.value,
       chartEndDateInput.value
     );
+    // A wider live window than the store covers needs the missing span from the server
+    const oldest = chartDataStore.currentTemp[0];
+    if (!oldest || oldest.x > minTime) {
+      loadHistoricalData(true);
+      return;
+    }
     pruneChartDataStore();
     filterAndApplyDataToChart(
       temperatureChart,
@@ -517,25 +529,52 @@ function applyCustomDateRange() {
   loadHistoricalData(true);
 }
 
+// History arrives as NDJSON; parse each line as it streams in instead of
+// holding the whole body and its parsed array in memory at once.
+async function readNdjson(response, onItem) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let pending = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    pending += decoder.decode(value, { stream: true });
+    const lines = pending.split("\n");
+    pending = lines.pop();
+    lines.forEach((line) => {
+      if (line) onItem(JSON.parse(line));
+    });
+  }
+  pending += decoder.decode();
+  if (pending) onItem(JSON.parse(pending));
+}
+
 async function loadHistoricalData(forceFilter = false) {
   try {
     addLogMessage("Loading temperature chart data from server...", "info");
-    const response = await fetch("/get_historical_data");
+    // Only the log from the start of the window is needed, or all of it when unbounded;
+    // the server answers live windows from memory when its recent points reach back far enough
+    const { minTime } = getChartTimeWindow(
+      chartTimeRangeSelect.value,
+      chartStartDateInput.value,
+      chartEndDateInput.value
+    );
+    const url = `/get_historical_data${minTime ? `?from=${minTime}` : "?full=1"}`;
+    const response = await fetch(url);
     if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-    const data = await response.json();
 
     chartDataStore.currentTemp = [];
     chartDataStore.setTempMin = [];
     chartDataStore.setTempMax = [];
 
-    data.forEach((point) => {
+    const addPoint = (point) =>
       addDataToTemperatureChartStore(
         point.x,
         point.current_temp,
         point.set_temp_min,
         point.set_temp_max
       );
-    });
+    await readNdjson(response, addPoint);
 
     chartDataStore.currentTemp.sort((a, b) => a.x - b.x);
     chartDataStore.setTempMin.sort((a, b) => a.x - b.x);
@@ -583,7 +622,7 @@ async function loadEqualizationData(forceFilter = false) {
 
     chartDataStore.equalizationEvents = data
       .map((d) => ({
-        x: new Date(d.server_time_iso).getTime(),
+        x: d.ts_ms,
         y: parseFloat(d.duration_s),
         target_temp: parseFloat(d.target_temp),
       }))